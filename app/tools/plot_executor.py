@@ -1,110 +1,285 @@
 import sys
-import os
-import io
 import ast
+import signal
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from types import MappingProxyType
 import pandas as pd
 import numpy as np
-from PIL import Image
-import base64
-from IPython.display import HTML, display
 import time
+import threading
+import weakref
 
 # Import from app.db module
 from app.db import connect_to_sql_server
 
-# Import plotly libraries
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.io as pio
+# Optional fast LTTB implementation; a NumPy fallback is used when it's not installed
+try:
+    from tsdownsample import MinMaxLTTBDownsampler
+except ImportError:
+    MinMaxLTTBDownsampler = None
+
+# Copy-on-Write lets executed code receive cheap views of the cached DataFrames;
+# it is always on (and the option deprecated) from pandas 3.0
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+# Plotly libraries are imported on first use by _load_plotly - they're slow to import and
+# not needed by the data loading helpers
+px = None
+go = None
+make_subplots = None
+pio = None
+_LIBRARY_BINDINGS = None  # Read-only snapshot of the library bindings exposed to executed plot code
+_image_renderer_started = False
+
+def _load_plotly():
+    """
+    Import the plotly libraries into the module globals and apply the one-time plotly
+    configuration. Safe to call repeatedly; only the first call does any work.
+    """
+    global px, go, make_subplots, pio, _LIBRARY_BINDINGS
+    if _LIBRARY_BINDINGS is not None:
+        return
+    
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    import plotly.io as pio
+    
+    # Set the default template once instead of having every figure pick it up per call
+    pio.templates.default = 'plotly_white'
+    
+    # Image export defaults, set once so each save doesn't have to pass them to the renderer
+    if hasattr(getattr(pio, 'kaleido', None), 'scope'):
+        # kaleido < 1: pio.kaleido.scope is a long-lived Chromium process shared by every export
+        pio.kaleido.scope.default_format = 'png'
+        pio.kaleido.scope.default_scale = 2
+        pio.kaleido.scope.mathjax = None
+    elif hasattr(pio, 'defaults'):
+        # kaleido >= 1: the browser is kept alive by a sync server, see _ensure_image_renderer
+        pio.defaults.default_format = 'png'
+        pio.defaults.default_scale = 2
+        pio.defaults.mathjax = None
+    
+    _LIBRARY_BINDINGS = MappingProxyType({
+        "pd": pd,
+        "np": np,
+        "px": px,
+        "go": go,
+        "make_subplots": make_subplots,
+        "plt": None  # In case code references plt but doesn't use it
+    })
+
+# Large-trace handling: SVG scatter traces get slow past a few thousand points
+WEBGL_POINT_THRESHOLD = 5000
+NO_DOWNSAMPLE_DIRECTIVE = "#!nodownsample"  # Put in plot code to keep every line point
+_PER_POINT_ATTRIBUTES = ("x", "y", "text", "hovertext", "customdata", "ids")
+
+# Output formats supported by execute_plot_code
+PLOT_OUTPUT_FORMATS = ('html', 'json', 'dict')
 
 # Global DataFrames to store preloaded data
 customer_df = None
 transaction_df = None
 last_data_refresh = 0
-DATA_REFRESH_INTERVAL = 300  # Refresh data every 5 minutes
+_cache_fingerprint = None  # (customer fingerprint, transaction fingerprint) of the cached tables
+_load_lock = threading.Lock()  # Serializes (re)loads so concurrent first requests don't each run SELECT *
 
-def load_data_tables(force_reload=False, server=None, database=None, auth_type='windows', username=None, password=None):
+# Worker pool used to run plot code off the request thread
+PLOT_WORKERS = 4
+PLOT_EXECUTION_TIMEOUT = 30  # Seconds plot code may run inside a worker before it is stopped
+PLOT_QUEUE_TIMEOUT = 30  # Seconds a request may wait for a free worker
+PLOT_KILL_GRACE = 5  # Extra seconds before code the worker couldn't stop gets its pool killed
+_plot_pool = None
+_pool_lock = threading.Lock()  # Guards creating and replacing _plot_pool
+# Worker processes of pools shut down while code may still run on them; shutdown() drops
+# the pool's own reference, and a later timeout on that pool still has to kill its worker
+_retired_pool_workers = weakref.WeakKeyDictionary()
+
+# Number of date ranges transaction_history is split into and fetched in parallel;
+# tune to the number of CPU cores the database server exposes
+TRANSACTION_LOAD_PARTITIONS = 4
+TRANSACTION_QUERY = "SELECT * FROM [master].[dbo].[transaction_history]"
+
+# Cheap freshness probes - a change in either result means the underlying table changed
+CUSTOMER_FINGERPRINT_QUERY = "SELECT COUNT(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM [master].[dbo].[customer_information]"
+TRANSACTION_FINGERPRINT_QUERY = "SELECT COUNT(*), MAX(transaction_id) FROM [master].[dbo].[transaction_history]"
+
+def _fetch_cache_fingerprint(cursor):
     """
-    Load both customer and transaction tables into memory.
-    Data is cached and only reloaded if force_reload is True or if the cache is older than DATA_REFRESH_INTERVAL.
+    Run the freshness probes and return a fingerprint of the current table contents.
     
     Args:
-        force_reload (bool): If True, force reloading the data even if cached
-        server, database, auth_type, username, password: Parameters passed to connect_to_sql_server
+        cursor: Open database cursor
         
     Returns:
-        tuple: (customer_df, transaction_df) - DataFrames containing the table data
+        tuple: ((customer_count, customer_checksum), (transaction_count, max_transaction_id))
     """
-    global customer_df, transaction_df, last_data_refresh
-    
-    # Check if we need to refresh the data
-    current_time = time.time()
-    if (not force_reload and 
-        customer_df is not None and 
-        transaction_df is not None and 
-        current_time - last_data_refresh < DATA_REFRESH_INTERVAL):
-        print(f"Using cached data (last refresh: {int((current_time - last_data_refresh)/60)} minutes ago)")
-        return customer_df, transaction_df
-    
-    # Connect to the database
-    conn, cursor = connect_to_sql_server(
-        server=server, 
-        database=database, 
-        auth_type=auth_type,
-        username=username,
-        password=password
-    )
+    cursor.execute(CUSTOMER_FINGERPRINT_QUERY)
+    customer_fingerprint = tuple(cursor.fetchone())
+    cursor.execute(TRANSACTION_FINGERPRINT_QUERY)
+    transaction_fingerprint = tuple(cursor.fetchone())
+    return customer_fingerprint, transaction_fingerprint
+
+def _fetch_transaction_partition(where_clause, params, connection_args):
+    """
+    Fetch one date range of transaction_history over its own database connection.
     
+    Args:
+        where_clause (str): WHERE clause selecting the partition, with ? placeholders
+        params (list): Values for the placeholders
+        connection_args (dict): Parameters passed to connect_to_sql_server
+        
+    Returns:
+        pandas.DataFrame: Rows of the partition
+    """
+    conn, cursor = connect_to_sql_server(**connection_args)
     if conn is None or cursor is None:
-        print("Failed to connect to the database. Using cached data if available.")
-        if customer_df is not None and transaction_df is not None:
-            return customer_df, transaction_df
-        return None, None
+        raise ConnectionError("Failed to connect to the database for a transaction partition")
     
     try:
-        print("Loading customer information table...")
-        customer_query = "SELECT * FROM [master].[dbo].[customer_information]"
-        customer_df = pd.read_sql(customer_query, conn)
-        print(f"Loaded {len(customer_df)} customer records with columns: {', '.join(customer_df.columns)}")
-        
-        print("Loading transaction history table...")
-        transaction_query = "SELECT * FROM [master].[dbo].[transaction_history]"
-        transaction_df = pd.read_sql(transaction_query, conn)
-        
-        # Convert transaction_date to datetime
-        if 'transaction_date' in transaction_df.columns:
-            transaction_df['transaction_date'] = pd.to_datetime(transaction_df['transaction_date'])
+        return pd.read_sql(f"{TRANSACTION_QUERY} WHERE {where_clause}", conn, params=params)
+    finally:
+        cursor.close()
+        conn.close()
+
+def _load_transaction_history(conn, cursor, connection_args, partitions=TRANSACTION_LOAD_PARTITIONS):
+    """
+    Load transaction_history, splitting it into equal transaction_date ranges that are
+    fetched in parallel threads (the ODBC driver releases the GIL while waiting on I/O).
+    Falls back to a single query over the existing connection if partitioning isn't possible.
+    
+    Args:
+        conn, cursor: Open database connection and cursor
+        connection_args (dict): Parameters passed to connect_to_sql_server for the partition connections
+        partitions (int): Number of date ranges to fetch in parallel
+        
+    Returns:
+        pandas.DataFrame: The full transaction history
+    """
+    if partitions > 1:
+        try:
+            cursor.execute("SELECT MIN(transaction_date), MAX(transaction_date) FROM [master].[dbo].[transaction_history]")
+            min_date, max_date = cursor.fetchone()
             
-        print(f"Loaded {len(transaction_df)} transaction records with columns: {', '.join(transaction_df.columns)}")
+            if min_date is not None and max_date is not None and min_date < max_date:
+                edges = [edge.to_pydatetime() for edge in pd.date_range(min_date, max_date, periods=partitions + 1).floor('s')]
+                
+                # The last range is closed and also picks up rows without a date
+                ranges = [("transaction_date >= ? AND transaction_date < ?", [lo, hi])
+                          for lo, hi in zip(edges[:-2], edges[1:-1])]
+                ranges.append(("transaction_date >= ? OR transaction_date IS NULL", [edges[-2]]))
+                
+                with ThreadPoolExecutor(max_workers=partitions) as executor:
+                    parts = list(executor.map(
+                        lambda partition: _fetch_transaction_partition(*partition, connection_args),
+                        ranges
+                    ))
+                return pd.concat(parts, ignore_index=True)
+        except Exception as e:
+            print(f"Partitioned transaction load failed ({str(e)}), falling back to a single query")
+    
+    return pd.read_sql(TRANSACTION_QUERY, conn)
+
+def load_data_tables(force_reload=False, server=None, database=None, auth_type='windows', username=None, password=None):
+    """
+    Load both customer and transaction tables into memory.
+    Data is cached and only reloaded if force_reload is True or if a freshness probe
+    (row count plus checksum / max id) shows that the tables changed since the last load.
+    
+    Args:
+        force_reload (bool): If True, force reloading the data even if cached
+        server, database, auth_type, username, password: Parameters passed to connect_to_sql_server
         
-        # Update the refresh timestamp
-        last_data_refresh = current_time
+    Returns:
+        tuple: (customer_df, transaction_df) - DataFrames containing the table data
+    """
+    global customer_df, transaction_df, last_data_refresh, _cache_fingerprint
+    
+    # Only one caller loads at a time; callers that waited on the lock then see an
+    # unchanged fingerprint and return the freshly cached tables
+    with _load_lock:
+        current_time = time.time()
         
-        # Close the connection
-        cursor.close()
-        conn.close()
-        print("Database connection closed")
+        connection_args = dict(
+            server=server, 
+            database=database, 
+            auth_type=auth_type,
+            username=username,
+            password=password
+        )
         
-        return customer_df, transaction_df
+        # Connect to the database
+        conn, cursor = connect_to_sql_server(**connection_args)
         
-    except Exception as e:
-        print(f"Error loading data tables: {str(e)}")
-        traceback.print_exc()
+        if conn is None or cursor is None:
+            print("Failed to connect to the database. Using cached data if available.")
+            if customer_df is not None and transaction_df is not None:
+                return customer_df, transaction_df
+            return None, None
         
-        # Close the connection if it was opened
-        if conn and cursor:
+        try:
+            # Probe the tables and skip the full reload when nothing has changed
+            fingerprint = _fetch_cache_fingerprint(cursor)
+            if (not force_reload and 
+                customer_df is not None and 
+                transaction_df is not None and 
+                fingerprint == _cache_fingerprint):
+                print(f"Using cached data (unchanged since last refresh {int((current_time - last_data_refresh)/60)} minutes ago)")
+                cursor.close()
+                conn.close()
+                return customer_df, transaction_df
+            
+            print("Loading customer information table...")
+            customer_query = "SELECT * FROM [master].[dbo].[customer_information]"
+            new_customer_df = pd.read_sql(customer_query, conn)
+            print(f"Loaded {len(new_customer_df)} customer records with columns: {', '.join(new_customer_df.columns)}")
+            
+            print("Loading transaction history table...")
+            new_transaction_df = _load_transaction_history(conn, cursor, connection_args)
+            
+            # Convert transaction_date to datetime
+            if 'transaction_date' in new_transaction_df.columns:
+                new_transaction_df['transaction_date'] = pd.to_datetime(new_transaction_df['transaction_date'])
+                
+            print(f"Loaded {len(new_transaction_df)} transaction records with columns: {', '.join(new_transaction_df.columns)}")
+            
+            # Publish both tables together so readers never see a half-refreshed cache
+            customer_df, transaction_df = new_customer_df, new_transaction_df
+            
+            # Update the refresh timestamp and fingerprint
+            last_data_refresh = current_time
+            _cache_fingerprint = fingerprint
+            
+            # Workers hold a copy of the old tables; restart them lazily with the new data
+            _reset_plot_pool()
+            
+            # Close the connection
             cursor.close()
             conn.close()
-            print("Database connection closed after error")
-        
-        # Return cached data if available
-        if customer_df is not None and transaction_df is not None:
-            print("Using cached data due to error")
+            print("Database connection closed")
+            
             return customer_df, transaction_df
-        
-        return None, None
+            
+        except Exception as e:
+            print(f"Error loading data tables: {str(e)}")
+            traceback.print_exc()
+            
+            # Close the connection if it was opened
+            if conn and cursor:
+                cursor.close()
+                conn.close()
+                print("Database connection closed after error")
+            
+            # Return cached data if available
+            if customer_df is not None and transaction_df is not None:
+                print("Using cached data due to error")
+                return customer_df, transaction_df
+            
+            return None, None
 
 def fetch_data_from_db(query, server=None, database=None, auth_type='windows', username=None, password=None):
     """
@@ -148,9 +323,346 @@ def fetch_data_from_db(query, server=None, database=None, auth_type='windows', u
         traceback.print_exc()
         return None
 
-def execute_plot_code(code, df=None, height=800, width=1000, use_preloaded_data=True):
+def _build_exec_globals(df=None, use_preloaded_data=True):
+    """
+    Build the globals dict for executing plot code.
+    
+    DataFrames are exposed as shallow Copy-on-Write copies, so in-place changes made by
+    the executed code (e.g. drop(..., inplace=True)) never leak into the cached tables.
+    
+    Args:
+        df (pandas.DataFrame, optional): Custom DataFrame to expose as 'df'
+        use_preloaded_data (bool): Whether to expose the preloaded customer/transaction data
+        
+    Returns:
+        dict: Writable globals for exec, seeded from the library bindings
+    """
+    _load_plotly()
+    exec_globals = dict(_LIBRARY_BINDINGS)
+    
+    if df is not None:
+        exec_globals["df"] = df.copy(deep=False)
+    
+    if use_preloaded_data:
+        if customer_df is not None:
+            exec_globals["customer_df"] = customer_df.copy(deep=False)
+        if transaction_df is not None:
+            exec_globals["transaction_df"] = transaction_df.copy(deep=False)
+    
+    return exec_globals
+
+def _lttb_indices(x, y, n_out):
+    """
+    Select n_out point indices with the Largest-Triangle-Three-Buckets algorithm.
+    
+    Args:
+        x (numpy.ndarray): Sorted numeric x values
+        y (numpy.ndarray): Numeric y values
+        n_out (int): Number of points to keep
+        
+    Returns:
+        numpy.ndarray: Indices of the points to keep, in ascending order
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    if MinMaxLTTBDownsampler is not None:
+        return MinMaxLTTBDownsampler().downsample(x, y, n_out=n_out)
+    
+    # Bucket edges for the points between the fixed first and last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        
+        # Keep the point forming the largest triangle with the previous pick and the next bucket's average
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected]) -
+            (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(area.argmax())
+        indices[i + 1] = selected
+    
+    return indices
+
+def _numeric_axis_values(values, n):
+    """
+    Return the trace's x values as a float array usable by LTTB, or None if they can't be.
+    """
+    if values is None:
+        return np.arange(n, dtype=float)
+    
+    array = np.asarray(values)
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype("datetime64[ns]").astype(np.int64).astype(float)
+    if np.issubdtype(array.dtype, np.number):
+        return array.astype(float)
+    return None
+
+def _has_other_per_point_arrays(properties, n, top_level=True):
+    """
+    Check whether a trace's properties hold length-n arrays outside _PER_POINT_ATTRIBUTES,
+    e.g. marker.color, marker.size or error_y.array.
+    """
+    for key, value in properties.items():
+        if top_level and key in _PER_POINT_ATTRIBUTES:
+            continue
+        if isinstance(value, dict):
+            if _has_other_per_point_arrays(value, n, top_level=False):
+                return True
+        elif not isinstance(value, str) and hasattr(value, "__len__") and len(value) == n:
+            return True
+    return False
+
+def _downsample_line_trace(trace, max_points):
+    """
+    Downsample a line trace in place to at most max_points with LTTB.
+    Traces with non-numeric, unsorted or missing values are left untouched, as are traces
+    with per-point arrays under other attributes (marker colors, error bars...), which
+    would otherwise keep their full length.
+    """
+    if trace.y is None or len(trace.y) <= max_points:
+        return
+    
+    n = len(trace.y)
+    if _has_other_per_point_arrays(trace.to_plotly_json(), n):
+        return
+    y = np.asarray(trace.y)
+    if not np.issubdtype(y.dtype, np.number):
+        return
+    y = y.astype(float)
+    x = _numeric_axis_values(trace.x, n)
+    if x is None or len(x) != n or not np.isfinite(y).all() or np.any(np.diff(x) < 0):
+        return
+    
+    indices = _lttb_indices(x, y, max_points)
+    for attribute in _PER_POINT_ATTRIBUTES:
+        values = trace[attribute]
+        if values is not None and not isinstance(values, str) and len(values) == n:
+            trace[attribute] = np.asarray(values)[indices]
+
+def _optimize_large_traces(fig, max_points, downsample=True):
+    """
+    Keep large figures responsive: downsample line traces to roughly one point per pixel
+    and render scatter traces above WEBGL_POINT_THRESHOLD points with WebGL (scattergl).
+    
+    Args:
+        fig (plotly.graph_objects.Figure): Figure to optimize in place
+        max_points (int): Maximum number of points to keep per line trace (usually the plot width)
+        downsample (bool): Whether line traces may be downsampled
+    """
+    upgraded = False
+    traces = []
+    for trace in fig.data:
+        if trace.type in ("scatter", "scattergl") and downsample and trace.mode and "lines" in trace.mode:
+            _downsample_line_trace(trace, max_points)
+        
+        point_count = len(trace.y) if trace.type == "scatter" and trace.y is not None else 0
+        if point_count > WEBGL_POINT_THRESHOLD and not trace.stackgroup:
+            properties = trace.to_plotly_json()
+            properties.pop("type", None)
+            trace = go.Scattergl(properties, skip_invalid=True)
+            upgraded = True
+        traces.append(trace)
+    
+    # Plotly doesn't allow changing a trace's type in place, so swap the traces out
+    if upgraded:
+        fig.data = ()
+        fig.add_traces(traces)
+
+def _preload_worker(customer_data, transaction_data):
+    """
+    Pool initializer: store the preloaded tables in the worker's module globals once,
+    so individual plot requests don't have to ship them to the worker.
+    """
+    global customer_df, transaction_df
+    customer_df = customer_data
+    transaction_df = transaction_data
+
+def _get_plot_pool():
+    """
+    Return the plot worker pool, creating it (and preloading the cached tables into
+    each worker) on first use.
+    """
+    global _plot_pool
+    with _pool_lock:
+        if _plot_pool is None:
+            _plot_pool = ProcessPoolExecutor(
+                max_workers=PLOT_WORKERS,
+                initializer=_preload_worker,
+                initargs=(customer_df, transaction_df)
+            )
+        return _plot_pool
+
+def _reset_plot_pool(pool=None, terminate=False):
+    """
+    Shut down the plot worker pool so the next request starts a fresh one.
+    
+    ProcessPoolExecutor can't cancel a single running task, so terminating kills every
+    worker: requests still running on the pool fail with BrokenProcessPool, not just
+    the one that timed out.
+    
+    Args:
+        pool (ProcessPoolExecutor, optional): Pool to shut down, defaults to the current one.
+            A pool that has already been replaced is shut down without touching its successor.
+        terminate (bool): If True, kill the worker processes instead of letting running code finish
+    """
+    global _plot_pool
+    with _pool_lock:
+        if pool is None:
+            pool = _plot_pool
+        if _plot_pool is pool:
+            _plot_pool = None
+    if pool is None:
+        return
+    
+    # There's no public way to list or stop a pool's workers before Python 3.14
+    workers = list((getattr(pool, "_processes", None) or {}).values()) or _retired_pool_workers.get(pool, [])
+    if terminate:
+        for process in workers:
+            process.terminate()
+    else:
+        _retired_pool_workers[pool] = workers
+    # A retired pool (e.g. after a data reload) finishes its queued requests on the old data
+    pool.shutdown(wait=False, cancel_futures=terminate)
+
+def _build_figure(code, df=None, height=800, width=1000, use_preloaded_data=True):
+    """
+    Execute the plot code in the current process and return the resulting figure,
+    sized and optimized for rendering.
+    
+    Args:
+        code (str): Python code to execute (should use Plotly for visualization)
+        df (pandas.DataFrame, optional): Custom DataFrame to use in the visualization
+        height (int): Height of the plot in pixels
+        width (int): Width of the plot in pixels
+        use_preloaded_data (bool): Whether to make preloaded data available in the execution context
+        
+    Returns:
+        plotly.graph_objects.Figure or None: The figure, or None if the code didn't create one
+        
+    Raises:
+        SyntaxError: If the code can't be parsed
+        Exception: Any error raised by the executed code
+    """
+    _load_plotly()
+    
+    # Clean the code (remove markdown code block syntax if present)
+    if "```python" in code:
+        code = code.strip().split("```python", 1)[1]
+    if "```" in code:
+        code = code.split("```", 1)[0]
+    code = code.strip()
+    
+    # Parse the input code
+    parsed_code = ast.parse(code)
+    
+    # Create a safe execution environment with necessary libraries and dataframes
+    exec_globals = _build_exec_globals(df, use_preloaded_data)
+    
+    # Execute the code with the dataframe(s)
+    exec(compile(parsed_code, filename="<ast>", mode="exec"), exec_globals)
+    
+    # Look for a figure object in the execution environment
+    fig = None
+    for var_name, var_value in exec_globals.items():
+        if var_name != "df" and var_name != "pd" and var_name != "np" and var_name != "px" and var_name != "go" and var_name != "make_subplots" and var_name != "plt":
+            if hasattr(var_value, 'update_layout'):  # It's likely a Plotly figure
+                fig = var_value
+                break
+    
+    # If no figure found, check for a 'fig' variable specifically
+    if fig is None and 'fig' in exec_globals:
+        fig = exec_globals['fig']
+    
+    if fig is None:
+        return None
+    
+    # Update the figure layout with the specified dimensions
+    fig.update_layout(
+        height=height,
+        width=width,
+        margin=dict(l=40, r=40, t=50, b=40)
+    )
+    
+    # Downsample / switch to WebGL for large datasets unless the code opts out
+    _optimize_large_traces(fig, max_points=width, downsample=NO_DOWNSAMPLE_DIRECTIVE not in code)
+    
+    return fig
+
+def _figure_to_html(fig):
+    """
+    Convert a figure to an embeddable HTML snippet. The figure was built by plotly's
+    own constructors, so it isn't re-validated against the schema.
+    """
+    return fig.to_html(include_plotlyjs='cdn', full_html=False, validate=False, config={'responsive': True})
+
+class _PlotTimeout(BaseException):
+    """
+    Raised in a plot worker when the code exceeds PLOT_EXECUTION_TIMEOUT. A BaseException
+    so a bare `except Exception` in the executed code can't swallow it.
+    """
+
+def _raise_plot_timeout(signum, frame):
+    raise _PlotTimeout()
+
+def _run_plot_code(code, df=None, height=800, width=1000, use_preloaded_data=True, output_format='html'):
+    """
+    Execute the plot code in the current process and return the plot in the requested format.
+    Runs inside a plot worker; see execute_plot_code for the arguments.
+    
+    The run time is limited to PLOT_EXECUTION_TIMEOUT with an interval timer, so it is
+    measured from when the worker starts the code, not from when the request was queued.
+    
+    Returns:
+        str or dict: HTML string, Plotly JSON string or figure dict, or error message
+    """
+    # The worker's one-time plotly import doesn't count towards the code's run time
+    _load_plotly()
+    
+    # Signal handlers can only be installed from the main thread (always the case in a worker)
+    use_timer = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    if use_timer:
+        signal.signal(signal.SIGALRM, _raise_plot_timeout)
+        signal.setitimer(signal.ITIMER_REAL, PLOT_EXECUTION_TIMEOUT)
+    try:
+        fig = _build_figure(code, df, height, width, use_preloaded_data)
+        
+        # If no figure found, return an error
+        if fig is None:
+            return "Error: No Plotly figure object found in the executed code. Make sure your code creates a figure named 'fig'."
+        
+        if output_format == 'json':
+            # Plain figure JSON the client can hand straight to Plotly.react
+            return pio.to_json(fig, validate=False, remove_uids=True)
+        if output_format == 'dict':
+            return fig.to_plotly_json()
+        return _figure_to_html(fig)
+        
+    except _PlotTimeout:
+        return f"Error executing code: execution timed out after {PLOT_EXECUTION_TIMEOUT} seconds"
+    except SyntaxError as e:
+        return f"Syntax Error: {str(e)}"
+    except Exception as e:
+        traceback.print_exc()
+        return f"Error executing code: {str(e)}"
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def execute_plot_code(code, df=None, height=800, width=1000, use_preloaded_data=True, output_format='html'):
     """
     Execute the generated Python code and return the interactive Plotly visualization.
+    The code runs in a worker process and is stopped if it runs longer than PLOT_EXECUTION_TIMEOUT;
+    requests that wait more than PLOT_QUEUE_TIMEOUT for a free worker are rejected as busy.
     
     Args:
         code (str): Python code to execute (should use Plotly for visualization)
@@ -158,83 +670,62 @@ def execute_plot_code(code, df=None, height=800, width=1000, use_preloaded_data=
         height (int): Height of the plot in pixels
         width (int): Width of the plot in pixels
         use_preloaded_data (bool): Whether to make preloaded data available in the execution context
+        output_format (str): 'html' for an embeddable HTML snippet, 'json' for the figure JSON
+            (render client-side with Plotly.react) or 'dict' for the figure as a Python dict
         
     Returns:
-        str: HTML string of the interactive plot, or error message
+        str or dict: The plot in the requested format, or error message
     """
     global customer_df, transaction_df
     
+    if output_format not in PLOT_OUTPUT_FORMATS:
+        return f"Error: Unsupported output_format '{output_format}'. Use one of: {', '.join(PLOT_OUTPUT_FORMATS)}"
+    
     # Load data if needed and not provided
     if use_preloaded_data and (customer_df is None or transaction_df is None):
         load_data_tables()
     
+    pool = None
     try:
-        # Clean the code (remove markdown code block syntax if present)
-        if "```python" in code:
-            code = code.strip().split("```python", 1)[1]
-        if "```" in code:
-            code = code.split("```", 1)[0]
-        code = code.strip()
-        
-        # Parse the input code
-        parsed_code = ast.parse(code)
-        
-        # Create a safe execution environment with necessary libraries
-        exec_globals = {
-            "pd": pd,
-            "np": np,
-            "px": px,
-            "go": go,
-            "make_subplots": make_subplots,
-            "plt": None  # In case code references plt but doesn't use it
-        }
-        
-        # Add the dataframes to the execution environment
-        if df is not None:
-            exec_globals["df"] = df
-        
-        if use_preloaded_data:
-            if customer_df is not None:
-                exec_globals["customer_df"] = customer_df
-            if transaction_df is not None:
-                exec_globals["transaction_df"] = transaction_df
-        
-        # Execute the code with the dataframe(s)
-        exec(compile(parsed_code, filename="<ast>", mode="exec"), exec_globals)
-        
-        # Look for a figure object in the execution environment
-        fig = None
-        for var_name, var_value in exec_globals.items():
-            if var_name != "df" and var_name != "pd" and var_name != "np" and var_name != "px" and var_name != "go" and var_name != "make_subplots" and var_name != "plt":
-                if hasattr(var_value, 'update_layout'):  # It's likely a Plotly figure
-                    fig = var_value
-                    break
-        
-        # If no figure found, check for a 'fig' variable specifically
-        if fig is None and 'fig' in exec_globals:
-            fig = exec_globals['fig']
-        
-        # If still no figure found, return an error
-        if fig is None:
-            return "Error: No Plotly figure object found in the executed code. Make sure your code creates a figure named 'fig'."
-        
-        # Update the figure layout with the specified dimensions
-        fig.update_layout(
-            height=height,
-            width=width,
-            margin=dict(l=40, r=40, t=50, b=40)
-        )
+        pool = _get_plot_pool()
+        future = pool.submit(_run_plot_code, code, df, height, width, use_preloaded_data, output_format)
+        try:
+            return future.result(timeout=PLOT_QUEUE_TIMEOUT + PLOT_EXECUTION_TIMEOUT)
+        except FutureTimeoutError:
+            # Still waiting for a worker: drop the request rather than count the wait as run time
+            if future.cancel():
+                return "Error executing code: all plot workers are busy, please try again"
         
-        # Convert the figure to HTML
-        html_str = fig.to_html(include_plotlyjs='cdn', full_html=False)
-        return html_str
+        # The job has been handed to a worker, which stops the code itself after
+        # PLOT_EXECUTION_TIMEOUT; only code the timer can't interrupt outlives the grace period
+        return future.result(timeout=PLOT_EXECUTION_TIMEOUT + PLOT_KILL_GRACE)
         
-    except SyntaxError as e:
-        return f"Syntax Error: {str(e)}"
+    except FutureTimeoutError:
+        # Takes down the whole pool, including other requests running on it
+        _reset_plot_pool(pool, terminate=True)
+        return f"Error executing code: execution timed out after {PLOT_EXECUTION_TIMEOUT} seconds"
+    except BrokenProcessPool as e:
+        _reset_plot_pool(pool)
+        return f"Error executing code: plot worker crashed ({str(e)})"
     except Exception as e:
         traceback.print_exc()
         return f"Error executing code: {str(e)}"
 
+def _in_notebook():
+    """
+    Check whether the module runs inside a Jupyter kernel. IPython is only looked up if it
+    has already been imported, since a notebook kernel always has it loaded.
+    """
+    ipython = sys.modules.get("IPython")
+    if ipython is None:
+        return False
+    try:
+        return ipython.get_ipython().__class__.__name__ == 'ZMQInteractiveShell'
+    except Exception:
+        return False
+
+_IN_NOTEBOOK = _in_notebook()
+
 def display_plot(html_content):
     """
     Display the HTML plot in a Jupyter notebook or return the HTML content.
@@ -245,13 +736,87 @@ def display_plot(html_content):
     Returns:
         str or None: HTML string if not in a Jupyter environment, else None after displaying
     """
-    try:
-        # Try to display in Jupyter notebook
-        display(HTML(html_content))
-        return None
-    except:
-        # Return HTML content if not in a Jupyter environment
+    if not _IN_NOTEBOOK:
         return html_content
+    
+    from IPython.display import HTML, display
+    display(HTML(html_content))
+    return None
+
+def _ensure_image_renderer():
+    """
+    Start a persistent kaleido renderer on first use, so Chromium is launched once
+    rather than once per saved image. A no-op with kaleido < 1, where pio.kaleido.scope
+    already persists between calls.
+    """
+    global _image_renderer_started
+    if _image_renderer_started:
+        return
+    _image_renderer_started = True
+    
+    try:
+        import kaleido
+        if hasattr(kaleido, 'start_sync_server'):
+            kaleido.start_sync_server(silence_warnings=True)
+    except Exception as e:
+        print(f"Could not start persistent image renderer, exporting per call: {str(e)}")
+
+def save_figures_to_images(figures, filenames, format="png"):
+    """
+    Save several already built figures as image files in one renderer round-trip.
+    
+    Args:
+        figures (list): Figures to save
+        filenames (list): Output file for each figure
+        format (str): Image format (png, jpg, svg, pdf)
+        
+    Returns:
+        list: Path to each saved image, or an error message per figure if the export failed
+    """
+    _load_plotly()
+    _ensure_image_renderer()
+    try:
+        if hasattr(pio, 'write_images'):
+            pio.write_images(list(figures), list(filenames), format=format, scale=2, validate=False)
+        else:
+            # kaleido < 1: render straight through the shared scope and write the bytes ourselves
+            for fig, filename in zip(figures, filenames):
+                with open(filename, "wb") as image_file:
+                    image_file.write(pio.kaleido.scope.transform(fig.to_dict(), format=format, scale=2))
+        
+        print(f"Plots saved to {', '.join(str(filename) for filename in filenames)}")
+        return list(filenames)
+        
+    except Exception as e:
+        traceback.print_exc()
+        return [f"Error saving plot: {str(e)}"] * len(filenames)
+
+def save_figure_to_image(fig, filename="plot.png", format="png", height=None, width=None):
+    """
+    Save an already built figure as an image file.
+    
+    Args:
+        fig (plotly.graph_objects.Figure): Figure to save
+        filename (str): Name of the output file
+        format (str): Image format (png, jpg, svg, pdf)
+        height (int, optional): Height of the image in pixels (defaults to the figure's height)
+        width (int, optional): Width of the image in pixels (defaults to the figure's width)
+        
+    Returns:
+        str: Path to the saved image or error message
+    """
+    _load_plotly()
+    _ensure_image_renderer()
+    try:
+        # Save the figure to the specified format
+        pio.write_image(fig, filename, format=format, scale=2, width=width, height=height, validate=False)  # scale=2 for better resolution
+        
+        print(f"Plot saved to {filename}")
+        return filename
+        
+    except Exception as e:
+        traceback.print_exc()
+        return f"Error saving plot: {str(e)}"
 
 def save_plot_to_image(code, df=None, filename="plot.png", format="png", height=800, width=1000, use_preloaded_data=True):
     """
@@ -276,71 +841,17 @@ def save_plot_to_image(code, df=None, filename="plot.png", format="png", height=
         load_data_tables()
     
     try:
-        # Clean the code (remove markdown code block syntax if present)
-        if "```python" in code:
-            code = code.strip().split("```python", 1)[1]
-        if "```" in code:
-            code = code.split("```", 1)[0]
-        code = code.strip()
-        
-        # Parse the input code
-        parsed_code = ast.parse(code)
-        
-        # Create a safe execution environment with necessary libraries
-        exec_globals = {
-            "pd": pd,
-            "np": np,
-            "px": px, 
-            "go": go,
-            "make_subplots": make_subplots,
-            "plt": None
-        }
-        
-        # Add the dataframes to the execution environment
-        if df is not None:
-            exec_globals["df"] = df
-        
-        if use_preloaded_data:
-            if customer_df is not None:
-                exec_globals["customer_df"] = customer_df
-            if transaction_df is not None:
-                exec_globals["transaction_df"] = transaction_df
-        
-        # Execute the code with the dataframe(s)
-        exec(compile(parsed_code, filename="<ast>", mode="exec"), exec_globals)
-        
-        # Look for a figure object in the execution environment
-        fig = None
-        for var_name, var_value in exec_globals.items():
-            if var_name != "df" and var_name != "pd" and var_name != "np" and var_name != "px" and var_name != "go" and var_name != "make_subplots" and var_name != "plt":
-                if hasattr(var_value, 'update_layout'):  # It's likely a Plotly figure
-                    fig = var_value
-                    break
-        
-        # If no figure found, check for a 'fig' variable specifically
-        if fig is None and 'fig' in exec_globals:
-            fig = exec_globals['fig']
-        
-        # If still no figure found, return an error
+        fig = _build_figure(code, df, height, width, use_preloaded_data)
+        
+        # If no figure found, return an error
         if fig is None:
             return "Error: No Plotly figure object found in the executed code. Make sure your code creates a figure named 'fig'."
         
-        # Update the figure layout with the specified dimensions
-        fig.update_layout(
-            height=height,
-            width=width,
-            margin=dict(l=40, r=40, t=50, b=40)
-        )
-        
-        # Save the figure to the specified format
-        pio.write_image(fig, filename, format=format, scale=2)  # scale=2 for better resolution
-        
-        print(f"Plot saved to {filename}")
-        return filename
-        
     except Exception as e:
         traceback.print_exc()
         return f"Error saving plot: {str(e)}"
+    
+    return save_figure_to_image(fig, filename, format)
 
 def example_usage():
     """
@@ -391,15 +902,17 @@ def example_usage():
         )
     """
     
-    # Execute the code and get the interactive HTML
-    html_plot = execute_plot_code(customer_example_code)
-    
-    # Display the plot
-    print("To display the plot in a notebook, use:")
-    print("display_plot(html_plot)")
-    
-    # Save the plot as an image
-    save_plot_to_image(customer_example_code, filename="customer_example_plot.png")
+    # Execute the code once and reuse the figure for both the interactive HTML and the image
+    fig = _build_figure(customer_example_code)
+    if fig is not None:
+        html_plot = _figure_to_html(fig)
+        
+        # Display the plot
+        print("To display the plot in a notebook, use:")
+        print("display_plot(html_plot)")
+        
+        # Save the plot as an image
+        save_figure_to_image(fig, "customer_example_plot.png")
     
     print("\n==== EXAMPLE 2: Using preloaded transaction data ====")
     
@@ -442,11 +955,11 @@ def example_usage():
         )
     """
     
-    # Execute the code and get the interactive HTML
-    html_plot = execute_plot_code(transaction_example_code)
-    
-    # Save the plot as an image
-    save_plot_to_image(transaction_example_code, filename="transaction_example_plot.png")
+    # Execute the code once and reuse the figure for both the interactive HTML and the image
+    fig = _build_figure(transaction_example_code)
+    if fig is not None:
+        html_plot = _figure_to_html(fig)
+        save_figure_to_image(fig, "transaction_example_plot.png")
     
     print("\n==== EXAMPLE 3: Using custom query data ====")
     
@@ -488,8 +1001,10 @@ def example_usage():
         """
         
         # Execute with custom data
-        html_plot = execute_plot_code(custom_example_code, custom_df, use_preloaded_data=False)
-        save_plot_to_image(custom_example_code, custom_df, "custom_example_plot.png", use_preloaded_data=False)
+        fig = _build_figure(custom_example_code, custom_df, use_preloaded_data=False)
+        if fig is not None:
+            html_plot = _figure_to_html(fig)
+            save_figure_to_image(fig, "custom_example_plot.png")
     
     print("\nTo use this module in another script:")
     print("from tools.plot_executor import load_data_tables, execute_plot_code, display_plot")
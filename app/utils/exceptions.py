@@ -6,11 +6,20 @@ from typing import Optional, Dict, Any
 
 
 class Text2SQLException(Exception):
-    """Base exception for Text2SQL application."""
+    """Base exception for Text2SQL application.
     
-    def __init__(self, message: str, error_code: Optional[str] = None, details: Optional[Dict[str, Any]] = None):
-        self.message = message
-        self.error_code = error_code
+    Subclasses declare their fixed error_code and default_message as class
+    attributes; instances only store the message and details (plus an
+    error_code override when one is passed).
+    """
+    
+    error_code: Optional[str] = None
+    default_message: str = "Text2SQL error"
+    
+    def __init__(self, message: Optional[str] = None, error_code: Optional[str] = None, details: Optional[Dict[str, Any]] = None):
+        self.message = message if message is not None else self.default_message
+        if error_code is not None:
+            self.error_code = error_code
         self.details = details or {}
         super().__init__(self.message)
 
@@ -18,106 +27,112 @@ class Text2SQLException(Exception):
 class SQLGenerationError(Text2SQLException):
     """Exception raised when SQL generation fails."""
     
-    def __init__(self, message: str = "SQL generation failed", **kwargs):
-        super().__init__(message, error_code="SQL_GENERATION_ERROR", **kwargs)
+    error_code = "SQL_GENERATION_ERROR"
+    default_message = "SQL generation failed"
 
 
 class SQLExecutionError(Text2SQLException):
     """Exception raised when SQL execution fails."""
     
-    def __init__(self, message: str = "SQL execution failed", **kwargs):
-        super().__init__(message, error_code="SQL_EXECUTION_ERROR", **kwargs)
+    error_code = "SQL_EXECUTION_ERROR"
+    default_message = "SQL execution failed"
 
 
 class SQLValidationError(Text2SQLException):
     """Exception raised when SQL validation fails."""
     
-    def __init__(self, message: str = "SQL validation failed", **kwargs):
-        super().__init__(message, error_code="SQL_VALIDATION_ERROR", **kwargs)
+    error_code = "SQL_VALIDATION_ERROR"
+    default_message = "SQL validation failed"
 
 
 class DatabaseConnectionError(Text2SQLException):
     """Exception raised when database connection fails."""
     
-    def __init__(self, message: str = "Database connection failed", **kwargs):
-        super().__init__(message, error_code="DATABASE_CONNECTION_ERROR", **kwargs)
+    error_code = "DATABASE_CONNECTION_ERROR"
+    default_message = "Database connection failed"
 
 
 class VectorDatabaseError(Text2SQLException):
     """Exception raised when vector database operations fail."""
     
-    def __init__(self, message: str = "Vector database operation failed", **kwargs):
-        super().__init__(message, error_code="VECTOR_DATABASE_ERROR", **kwargs)
+    error_code = "VECTOR_DATABASE_ERROR"
+    default_message = "Vector database operation failed"
 
 
 class ChartGenerationError(Text2SQLException):
     """Exception raised when chart generation fails."""
     
-    def __init__(self, message: str = "Chart generation failed", **kwargs):
-        super().__init__(message, error_code="CHART_GENERATION_ERROR", **kwargs)
+    error_code = "CHART_GENERATION_ERROR"
+    default_message = "Chart generation failed"
 
 
 class TableNotFoundError(Text2SQLException):
     """Exception raised when requested table is not found."""
     
+    error_code = "TABLE_NOT_FOUND"
+    
     def __init__(self, table_name: str, **kwargs):
         message = f"Table '{table_name}' not found"
-        super().__init__(message, error_code="TABLE_NOT_FOUND", **kwargs)
+        super().__init__(message, **kwargs)
 
 
 class InvalidQueryError(Text2SQLException):
     """Exception raised when query is invalid."""
     
-    def __init__(self, message: str = "Invalid query", **kwargs):
-        super().__init__(message, error_code="INVALID_QUERY", **kwargs)
+    error_code = "INVALID_QUERY"
+    default_message = "Invalid query"
 
 
 class AuthenticationError(Text2SQLException):
     """Exception raised when authentication fails."""
     
-    def __init__(self, message: str = "Authentication failed", **kwargs):
-        super().__init__(message, error_code="AUTHENTICATION_ERROR", **kwargs)
+    error_code = "AUTHENTICATION_ERROR"
+    default_message = "Authentication failed"
 
 
 class ConfigurationError(Text2SQLException):
     """Exception raised when configuration is invalid."""
     
-    def __init__(self, message: str = "Configuration error", **kwargs):
-        super().__init__(message, error_code="CONFIGURATION_ERROR", **kwargs)
+    error_code = "CONFIGURATION_ERROR"
+    default_message = "Configuration error"
 
 
 class ServiceUnavailableError(Text2SQLException):
     """Exception raised when a required service is unavailable."""
     
+    error_code = "SERVICE_UNAVAILABLE"
+    
     def __init__(self, service_name: str, **kwargs):
         message = f"Service '{service_name}' is unavailable"
-        super().__init__(message, error_code="SERVICE_UNAVAILABLE", **kwargs)
+        super().__init__(message, **kwargs)
 
 
 class RateLimitError(Text2SQLException):
     """Exception raised when rate limit is exceeded."""
     
-    def __init__(self, message: str = "Rate limit exceeded", **kwargs):
-        super().__init__(message, error_code="RATE_LIMIT_ERROR", **kwargs)
+    error_code = "RATE_LIMIT_ERROR"
+    default_message = "Rate limit exceeded"
 
 
 class TimeoutError(Text2SQLException):
     """Exception raised when operation times out."""
     
+    error_code = "TIMEOUT_ERROR"
+    
     def __init__(self, operation: str = "Operation", **kwargs):
         message = f"{operation} timed out"
-        super().__init__(message, error_code="TIMEOUT_ERROR", **kwargs)
+        super().__init__(message, **kwargs)
 
 
 class DataValidationError(Text2SQLException):
     """Exception raised when data validation fails."""
     
-    def __init__(self, message: str = "Data validation failed", **kwargs):
-        super().__init__(message, error_code="DATA_VALIDATION_ERROR", **kwargs)
+    error_code = "DATA_VALIDATION_ERROR"
+    default_message = "Data validation failed"
 
 
 class PermissionError(Text2SQLException):
     """Exception raised when user lacks required permissions."""
     
-    def __init__(self, message: str = "Permission denied", **kwargs):
-        super().__init__(message, error_code="PERMISSION_ERROR", **kwargs)
+    error_code = "PERMISSION_ERROR"
+    default_message = "Permission denied"
@@ -2,14 +2,91 @@
 Formatting utilities for response formatting and data presentation.
 """
 
-import json
+import csv
+import html
+import io
 import logging
-from typing import Any, Dict, List, Optional, Union
+import orjson
+import numpy as np
+import time
+from itertools import repeat
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Union
 from datetime import datetime, date
 from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
+# Scalar types orjson returns unchanged; floats (NaN/inf) and ints (64-bit limit)
+# can change or fail in the round-trip, so they are not included
+_JSON_NATIVE_SCALARS = frozenset((str, bool, type(None)))
+
+
+def _format_other_number(value: Any, decimal_places: int) -> str:
+    """Format values whose exact type isn't in _NUMBER_FORMATTERS (subclasses, non-numbers)."""
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, (float, Decimal)):
+        return f"{value:,.{decimal_places}f}"
+    return str(value)
+
+
+# DataFormatter.format_number dispatch on the exact value type
+_NUMBER_FORMATTERS = {
+    int: lambda value, decimal_places: f"{value:,}",
+    float: lambda value, decimal_places: f"{value:,.{decimal_places}f}",
+    Decimal: lambda value, decimal_places: f"{value:,.{decimal_places}f}",
+    type(None): lambda value, decimal_places: "N/A",
+}
+
+
+# Last (time.time(), ISO string) pair produced by _now_iso, replaced as one tuple
+# so readers never see a time from one call paired with the string from another
+_last_ts_cache = (0.0, "")
+
+
+def _now_iso() -> str:
+    """Current local time in ISO 8601, reused for calls within the same millisecond."""
+    global _last_ts_cache
+    t = time.time()
+    last_t, last_iso = _last_ts_cache
+    # A clock stepped backwards (e.g. by NTP) must not keep serving the cached string
+    if 0 <= t - last_t < 0.001:
+        return last_iso
+    iso = datetime.fromtimestamp(t).isoformat()
+    _last_ts_cache = (t, iso)
+    return iso
+
+
+def _json_default(value: Any) -> Any:
+    """Serialize values orjson doesn't support natively."""
+    if isinstance(value, Decimal):
+        return float(value)
+    # orjson rejects datetime subclasses such as pd.Timestamp; keep their ISO format
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _parse_embedded_json(data: Any) -> Any:
+    """Parse strings holding a JSON object or array, recursively."""
+    if isinstance(data, str):
+        stripped = data.lstrip()
+        if stripped[:1] in ("{", "["):
+            try:
+                return orjson.loads(stripped)
+            except orjson.JSONDecodeError:
+                return data
+        return data
+    
+    if isinstance(data, list):
+        return [_parse_embedded_json(item) for item in data]
+    
+    if isinstance(data, dict):
+        return {key: _parse_embedded_json(value) for key, value in data.items()}
+    
+    return data
+
 
 class ResponseFormatter:
     """Formatter for API responses and data presentation."""
@@ -35,7 +112,7 @@ class ResponseFormatter:
                 formatted_result = {
                     "status": result.get("status", "unknown"),
                     "query": result.get("query", ""),
-                    "data": ResponseFormatter._format_data(result.get("data")),
+                    "data": ResponseFormatter._format_data(result.get("data"), parse_embedded_json=True),
                     "row_count": 0,
                     "execution_time": result.get("execution_time"),
                     "error": result.get("error")
@@ -54,41 +131,34 @@ class ResponseFormatter:
             return results
     
     @staticmethod
-    def _format_data(data: Any) -> Any:
+    def _format_data(data: Any, parse_embedded_json: bool = False) -> Any:
         """
         Format data values for JSON serialization.
         
         Args:
             data: Data to format
+            parse_embedded_json: Whether to parse strings holding a JSON object or array.
+                This walks the converted payload in Python, so it still costs one pass
+                over every value; format_sql_results relies on it for its data field.
             
         Returns:
             JSON-serializable data
         """
         try:
-            if data is None:
-                return None
-            
-            if isinstance(data, str):
-                # Try to parse JSON strings
-                try:
-                    return json.loads(data)
-                except (json.JSONDecodeError, TypeError):
-                    return data
-            
-            elif isinstance(data, (datetime, date)):
-                return data.isoformat()
-            
-            elif isinstance(data, Decimal):
-                return float(data)
-            
-            elif isinstance(data, list):
-                return [ResponseFormatter._format_data(item) for item in data]
+            if type(data) in _JSON_NATIVE_SCALARS:
+                formatted = data
+            else:
+                # One round-trip through orjson converts dates, Decimals, numpy values etc. in C
+                formatted = orjson.loads(orjson.dumps(
+                    data,
+                    default=_json_default,
+                    option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                ))
             
-            elif isinstance(data, dict):
-                return {key: ResponseFormatter._format_data(value) for key, value in data.items()}
+            if parse_embedded_json:
+                formatted = _parse_embedded_json(formatted)
             
-            else:
-                return data
+            return formatted
                 
         except Exception as e:
             logger.error(f"Data formatting failed: {e}")
@@ -107,6 +177,8 @@ class ResponseFormatter:
         """
         try:
             formatted_messages = []
+            # Messages without a timestamp all share the time of this call
+            default_timestamp = _now_iso()
             
             for message in messages:
                 if not isinstance(message, dict):
@@ -115,7 +187,7 @@ class ResponseFormatter:
                 formatted_message = {
                     "role": message.get("role", "unknown"),
                     "content": ResponseFormatter._format_message_content(message.get("content")),
-                    "timestamp": message.get("timestamp", datetime.now().isoformat())
+                    "timestamp": message.get("timestamp", default_timestamp)
                 }
                 
                 # Add metadata if present
@@ -182,7 +254,7 @@ class ResponseFormatter:
             error_response = {
                 "success": False,
                 "error": str(error),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": _now_iso()
             }
             
             # Add error code if available
@@ -203,7 +275,7 @@ class ResponseFormatter:
             return {
                 "success": False,
                 "error": "An error occurred",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": _now_iso()
             }
 
 
@@ -240,29 +312,48 @@ class DataFormatter:
             logger.error(f"Table data formatting failed: {e}")
             return data
     
+    @staticmethod
+    def iter_csv(data: List[Dict[str, Any]], chunk_size: int = 1000) -> Iterator[str]:
+        """
+        Convert data to CSV format in chunks, to bound memory on large result sets.
+        
+        Args:
+            data: Table data; the first row's keys are used as headers
+            chunk_size: Number of rows per yielded chunk
+            
+        Yields:
+            CSV text, the header line first and then up to chunk_size rows per chunk
+        """
+        if not data:
+            return
+        
+        headers = list(data[0].keys())
+        # Rows sharing the first row's keys (the common case) are read with one
+        # C-level itemgetter call; extra keys are ignored like DictWriter does
+        get_values = itemgetter(*headers) if len(headers) > 1 else lambda row: (row[headers[0]],)
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+        writer.writerow(headers)
+        
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            try:
+                rows = list(map(get_values, chunk))
+            except KeyError:
+                # Schema drift within this chunk: fill missing columns with blanks
+                rows = [[row.get(header, "") for header in headers] for row in chunk]
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
     @staticmethod
     def _to_csv(data: List[Dict[str, Any]]) -> str:
         """Convert data to CSV format."""
         try:
-            if not data:
-                return ""
-            
-            # Get headers from first row
-            headers = list(data[0].keys())
-              # Create CSV content
-            csv_lines = [",".join(headers)]
-            
-            for row in data:
-                csv_row = []
-                for header in headers:
-                    value = row.get(header, "")
-                    # Escape commas and quotes
-                    if isinstance(value, str) and ("," in value or '"' in value):
-                        value = f'"{value.replace(chr(34), chr(34)+chr(34))}"'
-                    csv_row.append(str(value))
-                csv_lines.append(",".join(csv_row))
-            
-            return "\n".join(csv_lines)
+            # csv ends every row with a newline; the table text ends at the last row
+            return "".join(DataFormatter.iter_csv(data)).removesuffix("\n")
             
         except Exception as e:
             logger.error(f"CSV formatting failed: {e}")
@@ -284,16 +375,17 @@ class DataFormatter:
             # Header row
             html_parts.append("<thead><tr>")
             for header in headers:
-                html_parts.append(f"<th style='padding: 8px; background-color: #f2f2f2;'>{header}</th>")
+                html_parts.append(f"<th style='padding: 8px; background-color: #f2f2f2;'>{html.escape(str(header))}</th>")
             html_parts.append("</tr></thead>")
             
-            # Data rows
+            # Data rows; None and missing cells both render empty
             html_parts.append("<tbody>")
             for row in data:
                 html_parts.append("<tr>")
                 for header in headers:
-                    value = row.get(header, "")
-                    html_parts.append(f"<td style='padding: 8px;'>{value}</td>")
+                    value = row.get(header)
+                    cell = "" if value is None else html.escape(str(value))
+                    html_parts.append(f"<td style='padding: 8px;'>{cell}</td>")
                 html_parts.append("</tr>")
             html_parts.append("</tbody>")
             
@@ -344,17 +436,37 @@ class DataFormatter:
             Formatted number string
         """
         try:
-            if value is None:
-                return "N/A"
-            
-            if isinstance(value, (int, float, Decimal)):
-                if isinstance(value, int):
-                    return f"{value:,}"
-                else:
-                    return f"{value:,.{decimal_places}f}"
-            else:
-                return str(value)
+            return _NUMBER_FORMATTERS.get(type(value), _format_other_number)(value, decimal_places)
                 
         except Exception as e:
             logger.error(f"Number formatting failed: {e}")
             return str(value)
+    
+    @staticmethod
+    def format_numbers(values: Union[np.ndarray, List[Any]], decimal_places: int = 2) -> List[str]:
+        """
+        Format a column of numeric values for display; the batch form of format_number.
+        
+        Integer and float NumPy arrays are converted to Python numbers in one
+        tolist() call and formatted with a single format spec. Lists and other
+        sequences are formatted value by value, since a list mixing ints and
+        floats (or holding ints beyond 64 bits) would change type in an array.
+        
+        Args:
+            values: Numeric values
+            decimal_places: Number of decimal places for non-integer values
+            
+        Returns:
+            Formatted number strings, matching format_number for each value (for
+            arrays, for each element as returned by tolist())
+        """
+        try:
+            if not isinstance(values, np.ndarray) or values.dtype.kind not in "iuf":
+                return [DataFormatter.format_number(value, decimal_places) for value in values]
+            
+            spec = "," if values.dtype.kind in "iu" else f",.{decimal_places}f"
+            return list(map(format, values.ravel().tolist(), repeat(spec)))
+            
+        except Exception as e:
+            logger.error(f"Batch number formatting failed: {e}")
+            return [DataFormatter.format_number(value, decimal_places) for value in values]
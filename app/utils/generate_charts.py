@@ -6,11 +6,157 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from plotly.basedatatypes import BaseFigure
 import plotly.io as pio
+import re
 import time
 import ast
+from functools import lru_cache
 from IPython.display import HTML
 
+# Library bindings exposed to executed plot code, built once and copied per call
+_BASE_EXEC_GLOBALS = {
+    "pd": pd,
+    "np": np,
+    "px": px,
+    "go": go,
+    "make_subplots": make_subplots,
+    "plt": None,
+    "pio": pio,
+    "HTML": HTML
+}
+
+# Body of the first markdown code block; an unclosed block runs to the end of the text
+_CODE_FENCE_RE = re.compile(r'```(?:python)?\n?(.*?)(?:```|$)', re.DOTALL)
+
+# show() calls are commented out since the figure is returned instead of shown
+_SHOW_CALL_RE = re.compile(r'fig\.show\(\)|fig\.show|plt\.show\(\)|plt\.show')
+_SHOW_CALL_REPLACEMENTS = {
+    "fig.show()": "# fig will be returned instead",
+    "fig.show": "# fig.show",
+    "plt.show()": "# plt.show() removed",
+    "plt.show": "# plt.show",
+}
+
+def _replace_show_call(match):
+    return _SHOW_CALL_REPLACEMENTS[match.group(0)]
+
+@lru_cache(maxsize=256)
+def _sanitize(code):
+    """
+    Strip markdown code fences and neutralize show() calls in generated plot code.
+    
+    Args:
+        code (str): Raw generated code
+        
+    Returns:
+        str: Code ready to compile
+    """
+    # Clean the code (remove markdown code block syntax if present)
+    fence = _CODE_FENCE_RE.search(code)
+    if fence:
+        code = fence.group(1)
+    code = code.strip()
+    
+    # Replace fig.show() with a placeholder in a single pass
+    # This avoids nbformat errors and ensures proper rendering
+    return _SHOW_CALL_RE.sub(_replace_show_call, code)
+
+# DataFrame names plot code can use; only the ones it mentions are injected
+_FRAME_NAMES = frozenset(("df_customer_info", "df_transactions", "customer_df", "transaction_df", "df"))
+
+@lru_cache(maxsize=256)
+def _compile_code(code):
+    """
+    Parse and compile sanitized plot code; repeated renders of the same code reuse the result.
+    
+    Args:
+        code (str): Sanitized plot code
+        
+    Returns:
+        tuple: (code object, frozenset of the injectable DataFrame names the code uses)
+    """
+    tree = ast.parse(code, filename="<string>", mode="exec")
+    referenced = frozenset(
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and node.id in _FRAME_NAMES
+    )
+    return compile(tree, filename="<string>", mode="exec"), referenced
+
+# Custom CSS to ensure proper rendering in the notebook
+_CUSTOM_CSS = """
+        <style>
+        .plotly-graph-div .modebar {
+            opacity: 0.3;
+            transition: opacity 0.3s ease-in-out;
+        }
+        .plotly-graph-div .modebar:hover {
+            opacity: 1;
+        }
+        .plotly-graph-div {
+            border: 1px solid #e0e0e0;
+            border-radius: 8px;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.05);
+        }
+        </style>
+        """
+
+# Configure for notebook display with enhanced interactivity options
+_DEFAULT_CONFIG = {
+    'displayModeBar': True,
+    'responsive': True,
+    'scrollZoom': True,
+    'showTips': True,
+    'editable': True,
+    'toImageButtonOptions': {
+        'format': 'png',
+        'filename': 'plot',
+        'height': 700,
+        'width': 1000,
+        'scale': 2
+    },
+    'modeBarButtonsToAdd': [
+        'drawline',
+        'drawopenpath',
+        'drawclosedpath',
+        'drawcircle',
+        'drawrect',
+        'eraseshape'
+    ]
+}
+
+def _render_html(fig, height, width):
+    """
+    Render a figure to embeddable HTML.
+    
+    Args:
+        fig (plotly.graph_objects.Figure): Figure to render
+        height (int): Height of the plot in pixels
+        width (int): Width of the plot in pixels
+        
+    Returns:
+        str: HTML fragment including the custom CSS
+    """
+    # Only the image export size depends on the call; copy the config when it differs
+    config = _DEFAULT_CONFIG
+    image_options = _DEFAULT_CONFIG['toImageButtonOptions']
+    if height != image_options['height'] or width != image_options['width']:
+        config = {**_DEFAULT_CONFIG, 'toImageButtonOptions': {**image_options, 'height': height, 'width': width}}
+    
+    # Convert to HTML with full interactive capabilities
+    # Using full_html=False to avoid conflicts with notebook environment
+    # include_plotlyjs='cdn' ensures latest Plotly version is used
+    html_str = pio.to_html(
+        fig,
+        include_plotlyjs='cdn', 
+        full_html=False, 
+        config=config,
+        include_mathjax='cdn',  # Support for mathematical expressions
+        validate=False  # Figure was built by plotly's own constructors
+    )
+    
+    return f"{_CUSTOM_CSS}<div style='width:{width}px; margin:0 auto;'>{html_str}</div>"
+
 def execute_plot_code(code, df=None, height=700, width=1000, use_preloaded_data=True):
     """
     Execute the generated Python code and display the interactive Plotly visualization.
@@ -26,65 +172,44 @@ def execute_plot_code(code, df=None, height=700, width=1000, use_preloaded_data=
         IPython.display.HTML: Interactive Plotly visualization
     """
     try:
-        # Clean the code (remove markdown code block syntax if present)
-        if "```python" in code:
-            code = code.strip().split("```python", 1)[1]
-        elif "```" in code:
-            code = code.split("```", 1)[1]
-        if "```" in code:  # Handle closing backticks if present
-            code = code.split("```", 1)[0]
-        code = code.strip()
-        
-        # Replace fig.show() with a placeholder that we'll handle later
-        # This avoids nbformat errors and ensures proper rendering
-        code = code.replace("fig.show()", "# fig will be returned instead")
-        code = code.replace("fig.show", "# fig.show")
-        code = code.replace("plt.show()", "# plt.show() removed")
-        code = code.replace("plt.show", "# plt.show")
+        # Clean, parse and compile the code (cached for repeated renders of the same code);
+        # syntax errors surface here, before any DataFrames are bound
+        compiled_code, referenced = _compile_code(_sanitize(code))
         
         # Create execution environment with necessary libraries
-        exec_globals = {
-            "pd": pd,
-            "np": np,
-            "px": px,
-            "go": go,
-            "make_subplots": make_subplots,
-            "plt": None,
-            "pio": pio,
-            "HTML": HTML
-        }
+        exec_globals = _BASE_EXEC_GLOBALS.copy()
         
-        # Add dataframes to execution environment
-        if df is not None:
+        # Add dataframes to execution environment, only under names the code uses
+        if df is not None and "df" in referenced:
             exec_globals["df"] = df
         
         # Make preloaded data available if requested
         if use_preloaded_data:
             global_vars = globals()
             if 'df_customer_info' in global_vars:
-                exec_globals["df_customer_info"] = global_vars['df_customer_info']
-                exec_globals["customer_df"] = global_vars['df_customer_info']
+                for name in ("df_customer_info", "customer_df"):
+                    if name in referenced:
+                        exec_globals[name] = global_vars['df_customer_info']
             
             if 'df_transactions' in global_vars:
-                exec_globals["df_transactions"] = global_vars['df_transactions']
-                exec_globals["transaction_df"] = global_vars['df_transactions']
-                exec_globals["df"] = global_vars['df_transactions']
+                for name in ("df_transactions", "transaction_df", "df"):
+                    if name in referenced:
+                        exec_globals[name] = global_vars['df_transactions']
         
         # Execute the code
-        exec(compile(code, filename="<string>", mode="exec"), exec_globals)
+        preexec_keys = set(exec_globals)
+        exec(compiled_code, exec_globals)
         
         # Find the figure object
         fig = None
         if 'fig' in exec_globals:
             fig = exec_globals['fig']
         else:
-            # Look for any plotly figure
+            # Look for a plotly figure (Figure or FigureWidget) among the variables the code created
             for var_name, var_value in exec_globals.items():
-                if var_name not in ["pd", "np", "px", "go", "make_subplots", "plt", "pio", "HTML",
-                                    "df_customer_info", "df_transactions", "customer_df", "transaction_df", "df"]:
-                    if hasattr(var_value, 'update_layout'):
-                        fig = var_value
-                        break
+                if var_name not in preexec_keys and isinstance(var_value, BaseFigure):
+                    fig = var_value
+                    break
         
         if fig is None:
             return HTML("<div style='color:red; font-weight:bold'>No Plotly figure found. Make sure your code creates a figure named 'fig'.</div>")
@@ -97,59 +222,7 @@ def execute_plot_code(code, df=None, height=700, width=1000, use_preloaded_data=
             margin=dict(l=40, r=40, t=60, b=40)
         )
         
-        # Configure for notebook display with enhanced interactivity options
-        config = {
-            'displayModeBar': True,
-            'responsive': True,
-            'scrollZoom': True,
-            'showTips': True,
-            'editable': True,
-            'toImageButtonOptions': {
-                'format': 'png',
-                'filename': 'plot',
-                'height': height,
-                'width': width,
-                'scale': 2
-            },
-            'modeBarButtonsToAdd': [
-                'drawline',
-                'drawopenpath',
-                'drawclosedpath',
-                'drawcircle',
-                'drawrect',
-                'eraseshape'
-            ]
-        }
-        
-        # Convert to HTML with full interactive capabilities
-        # Using full_html=False to avoid conflicts with notebook environment
-        # include_plotlyjs='cdn' ensures latest Plotly version is used
-        html_str = fig.to_html(
-            include_plotlyjs='cdn', 
-            full_html=False, 
-            config=config,
-            include_mathjax='cdn'  # Support for mathematical expressions
-        )
-        
-        # Include custom CSS to ensure proper rendering in the notebook
-        custom_css = """
-        <style>
-        .plotly-graph-div .modebar {
-            opacity: 0.3;
-            transition: opacity 0.3s ease-in-out;
-        }
-        .plotly-graph-div .modebar:hover {
-            opacity: 1;
-        }
-        .plotly-graph-div {
-            border: 1px solid #e0e0e0;
-            border-radius: 8px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.05);
-        }
-        </style>
-        """
-        
-        return HTML(f"{custom_css}<div style='width:{width}px; margin:0 auto;'>{html_str}</div>")
+        return HTML(_render_html(fig, height, width))
         
     except SyntaxError as e:
         return HTML(f"<div style='color:red; font-weight:bold'>Syntax Error: {str(e)}</div><pre>{traceback.format_exc()}</pre>")
@@ -1,11 +1,75 @@
 # utils/mlflow_logger.py
+import contextvars
+import functools
 import mlflow
-import json
+import orjson
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
+# Indented output like json.dumps(indent=2); also handles numpy values, datetimes
+# and non-str dict keys, which json.dumps accepted
+_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+def _to_json(data):
+    # Kept as bytes; the artifact file is written in binary, so it's never re-encoded
+    return orjson.dumps(data, option=_JSON_OPTIONS)
+
+# Artifacts logged during the current chat run, keyed by filename, together with
+# the run's id. They are uploaded together by end_chat_run so each run costs one
+# artifact upload instead of one per log_* call. A ContextVar rather than a
+# thread-local, so concurrent async chats sharing the event-loop thread each get
+# their own buffer. None means no chat run is active.
+_chat_run = contextvars.ContextVar("mlflow_chat_run", default=None)
+
+def _buffer_text(text, artifact_file):
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    elif not isinstance(text, bytes):
+        raise TypeError(f"Artifact text must be str or bytes, not {type(text).__name__}")
+    _chat_run.get()[1][artifact_file] = text
+
+# With MLFLOW_ASYNC=1 the artifact upload runs in the background, off the
+# request path. Queued uploads still finish at interpreter exit, since
+# concurrent.futures joins its worker threads then.
+_ASYNC = os.environ.get("MLFLOW_ASYNC") == "1"
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mlflow-logger") if _ASYNC else None
+
+def _upload_artifacts(pending, run_id):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for artifact_file, content in pending.items():
+            with open(os.path.join(tmpdir, artifact_file), "wb") as f:
+                f.write(content)
+        # Target the run by id; the active-run stack isn't per chat under asyncio
+        mlflow.client.MlflowClient().log_artifacts(run_id, tmpdir)
+
+def _flush_pending(chat_run):
+    run_id, pending = chat_run
+    if not pending:
+        return
+    if _executor is not None:
+        _executor.submit(_upload_artifacts, pending, run_id)
+    else:
+        _upload_artifacts(pending, run_id)
+
+def _safe_log(fn):
+    """Make a log_* helper a no-op outside a chat run and swallow its failures."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Set by start_chat_run, so a misconfigured MLflow skips serialization entirely
+        if _chat_run.get() is None:
+            return None
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            return None
+    return wrapper
+
 def start_chat_run(user_input):
+    # Drop anything left over from a run that never reached end_chat_run
+    _chat_run.set(None)
     try:
         # Set tracking URI here instead of at module level
         try:
@@ -29,73 +93,61 @@ def start_chat_run(user_input):
             client.restore_experiment(experiment.experiment_id)
             
         mlflow.set_experiment(experiment_name)
-        mlflow.start_run(nested=True)
+        run = mlflow.start_run(nested=True)
+        _chat_run.set((run.info.run_id, {}))
         mlflow.log_param("user_input", user_input)
     except Exception as e:
         print(f"Failed to start MLflow run: {e}")
         # Continue without MLflow if it fails
 
+@_safe_log
 def log_router_response(message):
-    try:
-        mlflow.log_text(message, "router_response.json")
-    except:
-        pass
+    _buffer_text(message, "router_response.json")
 
+@_safe_log
 def log_table_retriever_response(message):
-    try:
-        mlflow.log_text(str(message), "table_retriever_response.txt")
-    except:
-        pass
+    _buffer_text(str(message), "table_retriever_response.txt")
 
+@_safe_log
 def log_sql_code(sql_code):
-    try:
-        mlflow.log_text(sql_code, "generated_sql_code.txt")
-    except:
-        pass
+    _buffer_text(sql_code, "generated_sql_code.txt")
 
+@_safe_log
 def log_sql_results(results):
-    try:
-        mlflow.log_text(json.dumps(results, indent=2), "sql_results.json")
-    except:
-        pass
+    _buffer_text(_to_json(results), "sql_results.json")
 
+@_safe_log
 def log_generated_chart_results(results):
-    try:
-        mlflow.log_text(json.dumps(results, indent=2), "generated_chart_results.txt")
-    except:
-        pass
+    _buffer_text(_to_json(results), "generated_chart_results.txt")
 
+@_safe_log
 def log_products(results):
-    try:
-        mlflow.log_text(json.dumps(results, indent=2), "products.txt")
-    except:
-        pass
+    _buffer_text(_to_json(results), "products.txt")
 
+@_safe_log
 def log_sql_analysis_error(info):
-    try:
-        mlflow.log_text(json.dumps(info, indent=2), "sql_analysis_error.txt")
-    except:
-        pass
+    _buffer_text(_to_json(info), "sql_analysis_error.txt")
 
+@_safe_log
 def log_required_tables(tables):
-    try:
-        mlflow.log_text(tables, "required_tables.txt")
-    except:
-        pass
+    _buffer_text(tables, "required_tables.txt")
 
+@_safe_log
 def log_polish_prompt(info):
-    try:
-        mlflow.log_text(json.dumps(info, indent=2), "polish_prompt.txt")
-    except:
-        pass
+    _buffer_text(_to_json(info), "polish_prompt.txt")
 
+@_safe_log
 def log_final_response(response):
+    _buffer_text(response, "final_response.txt")
+
+def end_chat_run():
+    chat_run = _chat_run.get()
+    _chat_run.set(None)
     try:
-        mlflow.log_text(response, "final_response.txt")
+        if chat_run is not None:
+            _flush_pending(chat_run)
     except:
         pass
-
-def end_chat_run():
     try:
         mlflow.end_run()
     except:
@@ -0,0 +1,79 @@
+"""
+Test QueryValidator Keyword Scanning
+This script checks that every keyword-scanning engine (re, Aho-Corasick, Hyperscan)
+blocks the same dangerous SQL.
+"""
+
+import sys
+from pathlib import Path
+
+# Add app directory to path
+app_dir = Path(__file__).parent / "app"
+sys.path.insert(0, str(app_dir.parent))
+
+from app.utils.validators import QueryValidator
+
+# (SQL, dangerous keywords it must be rejected for)
+DANGEROUS_SQL_CASES = [
+    ("SELECT 1; sp_executesql N'DROP TABLE customers'", ["SP_EXECUTESQL"]),
+    ("SELECT 1; EXEC sp_executesql N'SELECT 2'", ["EXEC", "SP_EXECUTESQL"]),
+    ("SELECT 1; sp_execute 1", ["SP_EXECUTE"]),
+    ("SELECT 1; xp_cmdshell 'dir'", ["XP_CMDSHELL"]),
+    ("SELECT * FROM t; DROP TABLE t", ["DROP"]),
+]
+
+# Column names that merely contain a keyword must stay valid
+SAFE_SQL_CASES = [
+    "SELECT last_updated, deleted_at FROM customers WHERE id = 1",
+]
+
+
+def _engines():
+    """Yield (name, hyperscan database, automaton) for each engine installed here."""
+    hyperscan_database = QueryValidator._HYPERSCAN_DATABASE
+    automaton = QueryValidator._DANGEROUS_AUTOMATON
+    yield "re", None, None
+    if automaton is not None:
+        yield "aho-corasick", None, automaton
+    if hyperscan_database is not None:
+        yield "hyperscan", hyperscan_database, automaton
+
+
+def _check_with_engine(sql, hyperscan_database, automaton):
+    """Run the uncached SQL checks with only the given engines enabled."""
+    saved = QueryValidator._HYPERSCAN_DATABASE, QueryValidator._DANGEROUS_AUTOMATON
+    QueryValidator._HYPERSCAN_DATABASE, QueryValidator._DANGEROUS_AUTOMATON = hyperscan_database, automaton
+    try:
+        return QueryValidator._check_sql_query.__wrapped__(sql)
+    finally:
+        QueryValidator._HYPERSCAN_DATABASE, QueryValidator._DANGEROUS_AUTOMATON = saved
+
+
+def test_dangerous_sql_rejected_by_every_engine():
+    """Dangerous SQL is rejected, naming the same keywords, whichever engine scans it."""
+    for name, hyperscan_database, automaton in _engines():
+        for sql, keywords in DANGEROUS_SQL_CASES:
+            result = _check_with_engine(sql, hyperscan_database, automaton)
+            assert not result.is_valid, f"{name} accepted {sql!r}"
+            for keyword in keywords:
+                assert QueryValidator._SQL_KEYWORD_WARNINGS[keyword] in result.warnings, \
+                    f"{name} missed {keyword} in {sql!r}"
+        print(f"  ✅ {name}: {len(DANGEROUS_SQL_CASES)} dangerous queries rejected")
+
+
+def test_safe_sql_accepted_by_every_engine():
+    """Keywords inside identifiers don't reject an otherwise valid query."""
+    for name, hyperscan_database, automaton in _engines():
+        for sql in SAFE_SQL_CASES:
+            result = _check_with_engine(sql, hyperscan_database, automaton)
+            assert result.is_valid, f"{name} rejected {sql!r}: {result.warnings}"
+        print(f"  ✅ {name}: {len(SAFE_SQL_CASES)} safe queries accepted")
+
+
+if __name__ == "__main__":
+    print("\n🚀 QueryValidator Keyword Scanning Test\n")
+
+    test_dangerous_sql_rejected_by_every_engine()
+    test_safe_sql_accepted_by_every_engine()
+
+    print("\n✅ Test complete!")